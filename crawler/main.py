@@ -1,22 +1,70 @@
-import gzip
-import hashlib
+import collections
+import functools
+import io
+import itertools
 import logging
 import sys
+import threading
 import time
-import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from urllib.parse import urljoin, urlparse, urlunparse
 from urllib.robotparser import RobotFileParser
 
+import orjson
 import requests
 import yaml
-from pymongo import MongoClient
+from lxml import etree
+from pymongo import MongoClient, UpdateOne
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
 )
 logger = logging.getLogger(__name__)
 
+# Размер буфера чтения при потоковой обработке sitemap
+READ_BUFFER_SIZE = 128 * 1024
+
+# Поля документа, нужные для проверок без загрузки HTML
+METADATA_PROJECTION = {"url": 1, "crawl_date": 1, "content_hash": 1}
+
+
+@functools.lru_cache(maxsize=200_000)
+def _parsed(url):
+    """Кешированный разбор URL"""
+    return urlparse(url)
+
+
+@functools.lru_cache(maxsize=1024)
+def _domain(scheme, netloc):
+    """Кешированная сборка адреса домена"""
+    return f"{scheme}://{netloc}"
+
+
+@functools.lru_cache(maxsize=200_000)
+def _normalize_url(url):
+    """Нормализация URL с кешированием результата"""
+    parsed = _parsed(url)
+    normalized = urlunparse(
+        (
+            parsed.scheme.lower(),
+            parsed.netloc.lower(),
+            parsed.path.rstrip("/") if parsed.path != "/" else "/",
+            parsed.params,
+            parsed.query,
+            "",
+        )
+    )
+    return normalized
+
 
 class WebCrawler:
     def __init__(self, config_path):
@@ -27,11 +75,29 @@ class WebCrawler:
         self.recheck_interval = self.config["logic"].get("recheck_interval", 86400)
         self.user_agent = self.config["logic"].get("user_agent", "SearchBot/1.0")
         self.respect_robots_txt = self.config["logic"].get("respect_robots_txt", True)
+        self.max_workers = self.config["logic"].get("max_workers", 16)
+        self.session = self._init_session()
         self.visited_urls = set()
-        self.queue = []
+        # Очередь хранится по столбцам: URL, источник и lastmod
+        self.queue_urls = collections.deque()
+        self.queue_sources = collections.deque()
+        self.queue_lastmod = collections.deque()
+        self.enqueued_urls = set()
+        # Пачка, снятая с очереди, и индексы ее еще не обработанных URL
+        self._batch = ([], [], [])
+        self._batch_pending = set()
+        self._drop_legacy_queue = False
         self.robots_parsers = {}
+        self._cached_can_fetch = functools.lru_cache(maxsize=50_000)(
+            self._can_fetch_path
+        )
         self.count_map = {}
         self.limit = 15000
+        self.batch_size = 500
+        self.write_batch_size = 100
+        self._pending_writes = []
+        self.host_locks = {}
+        self.last_fetch_time = {}
 
     def _load_config(self, config_path):
         """Загрузка конфигурации из YAML файла"""
@@ -60,8 +126,6 @@ class WebCrawler:
             db.documents.create_index("url", unique=True)
             db.documents.create_index("crawl_date")
             db.documents.create_index("source_name")
-            db.queue.create_index("url", unique=True)
-            db.queue.create_index("source_name")
 
             logger.info("Подключение к MongoDB установлено")
             return db
@@ -69,29 +133,31 @@ class WebCrawler:
             logger.error(f"Ошибка подключения к MongoDB: {e}")
             sys.exit(1)
 
+    def _init_session(self):
+        """Создание HTTP-сессии с пулом соединений и повторами запросов"""
+        session = requests.Session()
+        session.headers["Accept-Encoding"] = "gzip"
+        retry = Retry(
+            total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]
+        )
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=64, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     def normalize_url(self, url):
         """Нормализация URL"""
-        parsed = urlparse(url)
-        normalized = urlunparse(
-            (
-                parsed.scheme.lower(),
-                parsed.netloc.lower(),
-                parsed.path.rstrip("/") if parsed.path != "/" else "/",
-                parsed.params,
-                parsed.query,
-                "",
-            )
-        )
-        return normalized
+        return _normalize_url(url)
 
-    def calculate_hash(self, html_content):
+    def calculate_hash(self, html_bytes):
         """Вычисление хеша HTML содержимого"""
-        return hashlib.md5(html_content.encode("utf-8")).hexdigest()
+        # CRC32 вместе с длиной достаточно для проверки изменений страницы
+        return [zlib.crc32(html_bytes), len(html_bytes)]
 
     def get_robots_parser(self, base_url):
         """Получение или создание парсера robots.txt для домена"""
-        parsed = urlparse(base_url)
-        domain = f"{parsed.scheme}://{parsed.netloc}"
+        parsed = _parsed(base_url)
+        domain = _domain(parsed.scheme, parsed.netloc)
 
         if domain not in self.robots_parsers:
             robots_url = urljoin(domain, "/robots.txt")
@@ -122,8 +188,10 @@ class WebCrawler:
             return True
 
         try:
-            rp = self.get_robots_parser(url)
-            can_fetch = rp.can_fetch(self.user_agent, url)
+            parsed = _parsed(url)
+            domain = _domain(parsed.scheme, parsed.netloc)
+            path = urlunparse(("", "", parsed.path, parsed.params, parsed.query, ""))
+            can_fetch = self._cached_can_fetch(domain, path, self.user_agent)
 
             if not can_fetch:
                 logger.debug(f"URL запрещен robots.txt: {url}")
@@ -134,94 +202,127 @@ class WebCrawler:
             # В случае ошибки разрешаем обкачку
             return True
 
+    def _can_fetch_path(self, domain, path, user_agent):
+        """Проверка пути домена по правилам robots.txt (кешируется)"""
+        rp = self.get_robots_parser(domain)
+        return rp.can_fetch(user_agent, path)
+
     def parse_sitemap(self, sitemap_url, source_name):
-        """Парсинг sitemap.xml и добавление URL в очередь"""
+        """Потоковый парсинг sitemap.xml и добавление URL в очередь"""
+        # Лимит источника уже исчерпан - не загружаем sitemap
+        if self.count_map.get(source_name, 0) >= self.limit:
+            return
+
         try:
             logger.info(f"Парсинг sitemap: {sitemap_url}")
 
             headers = {"User-Agent": self.user_agent}
-            response = requests.get(sitemap_url, headers=headers, timeout=10)
+            response = self.session.get(
+                sitemap_url, headers=headers, timeout=10, stream=True
+            )
             response.raise_for_status()
 
-            # Проверяем, не gzip ли это
-            content = response.content
-            if sitemap_url.endswith(".gz"):
-                content = gzip.decompress(content)
+            with response:
+                # Читаем тело ответа потоком, не загружая его целиком в память
+                response.raw.decode_content = True
+                # Иначе urllib3 закроет поток в конце тела до EOF буфера
+                response.raw.auto_close = False
+                stream = io.BufferedReader(response.raw, READ_BUFFER_SIZE)
+
+                # Проверяем, не gzip ли это - распаковываем на лету
+                if sitemap_url.endswith(".gz"):
+                    stream = gzip.GzipFile(fileobj=stream)
+
+                nested_sitemaps = []
+                urls_found = 0
+                urls_added = 0
+                urls_duplicate = 0
+                count = self.count_map.get(source_name, 0)
+
+                # Парсим XML за один проход, обрабатывая элементы по мере закрытия
+                context = etree.iterparse(
+                    stream, events=("end",), tag=("{*}sitemap", "{*}url")
+                )
+                for _, elem in context:
+                    tag = etree.QName(elem).localname
+                    loc = elem.findtext("{*}loc")
+
+                    if tag == "sitemap":
+                        if loc:
+                            nested_sitemaps.append(loc)
+
+                    else:
+                        urls_found += 1
+
+                        if loc:
+                            url = self.normalize_url(loc)
+
+                            # Пропускаем URL, уже добавленные в очередь
+                            if url in self.enqueued_urls:
+                                urls_duplicate += 1
+
+                            # Проверяем robots.txt
+                            elif self.can_fetch(url) or True:
+                                # Получаем lastmod если есть
+                                lastmod = elem.findtext("{*}lastmod")
+
+                                lastmod_date = None
+                                if lastmod:
+                                    try:
+                                        lastmod_date = datetime.fromisoformat(
+                                            lastmod.replace("Z", "+00:00")
+                                        ).timestamp()
+                                    except:
+                                        pass
 
-            # Парсим XML
-            root = ET.fromstring(content)
+                                if count >= self.limit:
+                                    return
 
-            # Убираем namespace из тега для простоты
-            root_tag = root.tag.split("}")[-1] if "}" in root.tag else root.tag
+                                self.enqueue(url, source_name, lastmod_date)
+                                urls_added += 1
+                                count += 1
+                                self.count_map[source_name] = count
 
-            urls_added = 0
+                    # Освобождаем обработанные элементы, чтобы дерево не росло
+                    elem.clear()
+                    while elem.getprevious() is not None:
+                        del elem.getparent()[0]
+
+                root_tag = etree.QName(context.root).localname
 
             # Проверяем тип sitemap по корневому тегу
             if root_tag == "sitemapindex":
                 # Это sitemap index - парсим вложенные sitemap
-                sitemaps = root.findall(".//{*}sitemap")
                 logger.info(
-                    f"Найден sitemap index с {len(sitemaps)} вложенными sitemap"
+                    f"Найден sitemap index с {len(nested_sitemaps)} вложенными sitemap"
                 )
 
-                for sitemap in sitemaps:
-                    loc = sitemap.find("{*}loc")
-                    if loc is not None and loc.text:
-                        self.parse_sitemap(loc.text, source_name)
+                for nested_url in nested_sitemaps:
+                    if self.count_map.get(source_name, 0) >= self.limit:
+                        logger.info(f"Достигнут лимит URL для {source_name}")
+                        break
+                    self.parse_sitemap(nested_url, source_name)
 
             elif root_tag == "urlset":
                 # Это обычный sitemap с URL'ами
-                urls = root.findall(".//{*}url")
-                logger.info(f"Найдено {len(urls)} URL в sitemap")
-
-                for url_elem in urls:
-                    loc = url_elem.find("{*}loc")
-
-                    if loc is not None and loc.text:
-                        url = self.normalize_url(loc.text)
-
-                        # Проверяем robots.txt
-                        if self.can_fetch(url) or True:
-                            # Получаем lastmod если есть
-                            lastmod = url_elem.find("{*}lastmod")
-
-                            lastmod_date = None
-                            if lastmod is not None and lastmod.text:
-                                try:
-                                    lastmod_date = datetime.fromisoformat(
-                                        lastmod.text.replace("Z", "+00:00")
-                                    ).timestamp()
-                                except:
-                                    pass
-
-                            if self.count_map.get(source_name, 0) >= self.limit:
-                                return
-
-                            self.queue.append(
-                                {
-                                    "url": url,
-                                    "source_name": source_name,
-                                    "lastmod": lastmod_date,
-                                }
-                            )
-                            urls_added += 1
-                            self.count_map[source_name] = (
-                                self.count_map.get(source_name, 0) + 1
-                            )
-
-                if urls_added == 0 and len(urls) > 0:
+                logger.info(f"Найдено {urls_found} URL в sitemap")
+
+                if urls_added == 0 and urls_found > urls_duplicate:
                     logger.warning(
-                        f"Все {len(urls)} URL из sitemap заблокированы robots.txt!"
+                        f"Все {urls_found} URL из sitemap заблокированы robots.txt!"
                     )
                     logger.warning(
                         f"Проверьте robots.txt для этого домена или установите respect_robots_txt: false в конфиге"
                     )
 
+                if urls_duplicate:
+                    logger.info(f"Пропущено {urls_duplicate} повторяющихся URL")
+
                 logger.info(f"Добавлено {urls_added} URL из sitemap")
             else:
                 logger.warning(f"Неизвестный тип sitemap: корневой тег '{root_tag}'")
 
-        except ET.ParseError as e:
+        except etree.XMLSyntaxError as e:
             logger.error(f"Ошибка парсинга XML sitemap {sitemap_url}: {e}")
         except requests.RequestException as e:
             logger.error(f"Ошибка загрузки sitemap {sitemap_url}: {e}")
@@ -230,6 +331,10 @@ class WebCrawler:
 
     def discover_sitemaps(self, base_url, source_name):
         """Обнаружение sitemap через robots.txt и стандартные пути"""
+        if self.count_map.get(source_name, 0) >= self.limit:
+            logger.info(f"Достигнут лимит URL для {source_name}")
+            return
+
         sitemaps = []
 
         # 1. Пытаемся найти sitemap в robots.txt
@@ -250,14 +355,14 @@ class WebCrawler:
             "/sitemap/sitemap.xml",
         ]
 
-        parsed = urlparse(base_url)
-        domain = f"{parsed.scheme}://{parsed.netloc}"
+        parsed = _parsed(base_url)
+        domain = _domain(parsed.scheme, parsed.netloc)
 
         for path in standard_paths:
             sitemap_url = urljoin(domain, path)
             try:
                 headers = {"User-Agent": self.user_agent}
-                response = requests.head(sitemap_url, headers=headers, timeout=5)
+                response = self.session.head(sitemap_url, headers=headers, timeout=5)
                 if response.status_code == 200:
                     if sitemap_url not in sitemaps:
                         sitemaps.append(sitemap_url)
@@ -270,32 +375,64 @@ class WebCrawler:
         # 3. Парсим все найденные sitemap'ы
         if sitemaps:
             for sitemap_url in sitemaps:
+                if self.count_map.get(source_name, 0) >= self.limit:
+                    logger.info(f"Достигнут лимит URL для {source_name}")
+                    break
                 self.parse_sitemap(sitemap_url, source_name)
         else:
             logger.warning(f"Sitemap не найден для {base_url}")
             # Добавляем сам base_url в очередь как fallback
-            self.queue.append(
-                {
-                    "url": self.normalize_url(base_url),
-                    "source_name": source_name,
-                    "lastmod": None,
-                }
-            )
+            url = self.normalize_url(base_url)
+            if url not in self.enqueued_urls:
+                self.enqueue(url, source_name, None)
+
+    def enqueue(self, url, source_name, lastmod):
+        """Добавление URL в очередь обкачки"""
+        self.enqueued_urls.add(url)
+        self.queue_urls.append(url)
+        self.queue_sources.append(source_name)
+        self.queue_lastmod.append(lastmod)
 
     def fetch_page(self, url):
         """Загрузка страницы по URL"""
         try:
             headers = {"User-Agent": self.user_agent}
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            return response.text
+            with self.session.get(
+                url, headers=headers, timeout=10, stream=True
+            ) as response:
+                response.raise_for_status()
+                # Кодировку определяем так же, как response.text
+                encoding = response.encoding or response.apparent_encoding
+                return response.content, encoding
         except requests.RequestException as e:
             logger.error(f"Ошибка при загрузке {url}: {e}")
             return None
 
-    def should_recrawl(self, url, lastmod=None):
+    def fetch_page_politely(self, url):
+        """Загрузка страницы с соблюдением задержки между запросами к хосту"""
+        host = _parsed(url).netloc
+
+        with self.host_locks[host]:
+            wait = self.last_fetch_time.get(host, 0) + self.delay - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                return self.fetch_page(url)
+            finally:
+                self.last_fetch_time[host] = time.monotonic()
+
+    def fetch_existing_documents(self, urls):
+        """Пакетная загрузка метаданных уже обкачанных документов"""
+        cursor = self.db.documents.find({"url": {"$in": urls}}, METADATA_PROJECTION)
+        return {doc["url"]: doc for doc in cursor}
+
+    def should_recrawl(self, url, lastmod=None, existing=None):
         """Проверка, нужно ли переобкачать документ"""
-        doc = self.db.documents.find_one({"url": url})
+        if existing is not None:
+            doc = existing.get(url)
+        else:
+            doc = self.db.documents.find_one({"url": url}, METADATA_PROJECTION)
         if not doc:
             return True
 
@@ -310,27 +447,42 @@ class WebCrawler:
         # Иначе проверяем по интервалу
         return (current_time - last_crawl) > self.recheck_interval
 
-    def save_document(self, url, html_content, source_name):
+    def save_document(
+        self, url, html_bytes, source_name, existing=None, encoding="utf-8"
+    ):
         """Сохранение документа в базу данных"""
         normalized_url = self.normalize_url(url)
-        content_hash = self.calculate_hash(html_content)
+        content_hash = self.calculate_hash(html_bytes)
         current_time = int(time.time())
 
         # Проверяем, изменился ли документ
-        existing_doc = self.db.documents.find_one({"url": normalized_url})
+        if existing is not None:
+            existing_doc = existing.get(normalized_url)
+        else:
+            existing_doc = self.db.documents.find_one(
+                {"url": normalized_url}, METADATA_PROJECTION
+            )
 
         if existing_doc:
-            old_hash = existing_doc.get("content_hash", "")
+            old_hash = existing_doc.get("content_hash")
             if old_hash == content_hash:
                 logger.info(f"Документ не изменился: {normalized_url}")
                 # Обновляем только дату проверки
-                self.db.documents.update_one(
-                    {"url": normalized_url}, {"$set": {"last_check_date": current_time}}
+                self._queue_write(
+                    UpdateOne(
+                        {"url": normalized_url},
+                        {"$set": {"last_check_date": current_time}},
+                    )
                 )
                 return False
             else:
                 logger.info(f"Документ изменился, обновляем: {normalized_url}")
 
+        try:
+            html_content = str(html_bytes, encoding, errors="replace")
+        except (LookupError, TypeError):
+            html_content = str(html_bytes, errors="replace")
+
         # Сохраняем или обновляем документ
         document = {
             "url": normalized_url,
@@ -341,34 +493,80 @@ class WebCrawler:
             "content_hash": content_hash,
         }
 
-        self.db.documents.update_one(
-            {"url": normalized_url}, {"$set": document}, upsert=True
+        self._queue_write(
+            UpdateOne({"url": normalized_url}, {"$set": document}, upsert=True)
         )
 
         logger.info(f"Документ сохранен: {normalized_url}")
         return True
 
+    def _queue_write(self, operation):
+        """Добавление операции записи документа в буфер"""
+        self._pending_writes.append(operation)
+        if len(self._pending_writes) >= self.write_batch_size:
+            self.flush_writes()
+
+    def flush_writes(self):
+        """Пакетная запись накопленных документов в БД"""
+        if not self._pending_writes:
+            return
+
+        self.db.documents.bulk_write(self._pending_writes, ordered=False)
+        self._pending_writes.clear()
+
     def save_queue_state(self):
         """Сохранение состояния очереди в БД"""
+        # Дописываем накопленные документы до сохранения очереди, иначе
+        # снимок очереди разойдется с содержимым documents
+        try:
+            self.flush_writes()
+        except Exception as e:
+            logger.error(
+                f"Ошибка записи документов, состояние очереди не сохранено: {e}"
+            )
+            return
+
         try:
-            # Удаляем старую очередь
-            self.db.queue.delete_many({})
+            # Сохраняем очередь одним сжатым документом; необработанные URL
+            # текущей пачки идут в начало, как после ее завершения
+            pending_urls, pending_sources, pending_lastmods = self._unfinished_batch()
+            state = {
+                "url": pending_urls + list(self.queue_urls),
+                "source_name": pending_sources + list(self.queue_sources),
+                "lastmod": pending_lastmods + list(self.queue_lastmod),
+            }
+            blob = zlib.compress(orjson.dumps(state), level=1)
+            self.db.queue_state.replace_one(
+                {"_id": "queue"},
+                {"_id": "queue", "blob": blob, "ts": int(time.time())},
+                upsert=True,
+            )
 
-            # Сохраняем текущую очередь
-            if self.queue:
-                self.db.queue.insert_many(self.queue)
+            # Очередь из старого формата перенесена - удаляем коллекцию
+            if self._drop_legacy_queue:
+                self.db.queue.drop()
+                self._drop_legacy_queue = False
+                logger.info("Старая коллекция queue удалена после переноса")
 
-            logger.info(f"Состояние очереди сохранено ({len(self.queue)} URLs)")
+            logger.info(f"Состояние очереди сохранено ({len(state['url'])} URLs)")
         except Exception as e:
             logger.error(f"Ошибка сохранения очереди: {e}")
 
     def load_queue_state(self):
         """Загрузка состояния очереди из БД"""
         try:
-            queue_docs = list(self.db.queue.find())
-            if queue_docs:
-                self.queue = queue_docs
-                logger.info(f"Очередь восстановлена ({len(self.queue)} URLs)")
+            doc = self.db.queue_state.find_one({"_id": "queue"})
+            if doc:
+                state = orjson.loads(zlib.decompress(doc["blob"]))
+            else:
+                state = self._load_legacy_queue()
+            if state and state["url"]:
+                self.queue_urls = collections.deque(state["url"])
+                self.queue_sources = collections.deque(state["source_name"])
+                self.queue_lastmod = collections.deque(state["lastmod"])
+                self.enqueued_urls = set(self.queue_urls)
+                self._interleave_queue()
+                logger.info(f"Очередь восстановлена ({len(self.queue_urls)} URLs)")
                 return True
             else:
                 logger.info("Очередь пуста, начинаем с источников из конфига")
@@ -377,6 +575,20 @@ class WebCrawler:
             logger.error(f"Ошибка загрузки очереди: {e}")
             return False
 
+    def _load_legacy_queue(self):
+        """Чтение очереди, сохраненной по документу на URL в коллекции queue"""
+        items = list(self.db.queue.find({}, {"_id": 0}))
+        if not items:
+            return None
+
+        logger.info(f"Найдена очередь в старом формате ({len(items)} URLs)")
+        self._drop_legacy_queue = True
+        return {
+            "url": [item["url"] for item in items],
+            "source_name": [item.get("source_name") for item in items],
+            "lastmod": [item.get("lastmod") for item in items],
+        }
+
     def initialize_sources(self):
         """Инициализация источников данных из конфига"""
         logger.info(f"Инициализация {len(self.sources)} источников")
@@ -394,39 +606,68 @@ class WebCrawler:
             # Обнаруживаем и парсим sitemap'ы
             self.discover_sitemaps(base_url, source_name)
 
-        logger.info(f"Инициализация завершена. В очереди {len(self.queue)} URL")
-
-    def crawl(self):
-        """Основной цикл обкачки"""
-        logger.info("Запуск поискового робота")
+        self._interleave_queue()
+        logger.info(f"Инициализация завершена. В очереди {len(self.queue_urls)} URL")
 
-        # Пытаемся загрузить состояние очереди
-        if not self.load_queue_state():
-            # Если очередь пуста, инициализируем из источников
-            self.initialize_sources()
-            self.save_queue_state()
+    def _interleave_queue(self):
+        """Чередование URL разных хостов, чтобы пачка обкачивалась параллельно"""
+        groups = {}
+        for item in zip(self.queue_urls, self.queue_sources, self.queue_lastmod):
+            groups.setdefault(_parsed(item[0]).netloc, []).append(item)
 
-        if not self.queue:
-            logger.error("Очередь пуста! Нечего обкачивать.")
+        if len(groups) < 2:
             return
 
-        try:
-            processed_count = 0
+        items = [
+            item
+            for round_items in itertools.zip_longest(*groups.values())
+            for item in round_items
+            if item is not None
+        ]
+        self.queue_urls = collections.deque(item[0] for item in items)
+        self.queue_sources = collections.deque(item[1] for item in items)
+        self.queue_lastmod = collections.deque(item[2] for item in items)
+
+    def _pop_batch(self):
+        """Извлечение очередной пачки URL из начала очереди"""
+        size = min(self.batch_size, len(self.queue_urls))
+        urls = [self.queue_urls.popleft() for _ in range(size)]
+        sources = [self.queue_sources.popleft() for _ in range(size)]
+        lastmods = [self.queue_lastmod.popleft() for _ in range(size)]
+        return urls, sources, lastmods
+
+    def _unfinished_batch(self):
+        """Необработанные URL текущей пачки в порядке очереди"""
+        urls, sources, lastmods = self._batch
+        pending = sorted(self._batch_pending)
+        return (
+            [urls[i] for i in pending],
+            [sources[i] for i in pending],
+            [lastmods[i] for i in pending],
+        )
 
-            while self.queue:
-                item = self.queue.pop(0)
-                url = item["url"]
-                source_name = item["source_name"]
-                lastmod = item.get("lastmod")
+    def _crawl_batch(self, executor, urls, sources, lastmods, processed_count):
+        """Параллельная обкачка пачки URL из очереди"""
+        # Пока URL пачки не обработан, он считается частью очереди
+        self._batch = (urls, sources, lastmods)
+        self._batch_pending = set(range(len(urls)))
+        futures = {}
 
+        try:
+            # Загружаем метаданные документов пачки одним запросом
+            existing = self.fetch_existing_documents(urls)
+
+            for i, url in enumerate(urls):
                 # Проверяем, не обрабатывали ли уже
                 if url in self.visited_urls:
+                    self._batch_pending.discard(i)
                     continue
 
                 # Проверяем, нужно ли обкачивать
-                if not self.should_recrawl(url, lastmod):
+                if not self.should_recrawl(url, lastmods[i], existing):
                     logger.info(f"Пропускаем (недавно обкачан): {url}")
                     self.visited_urls.add(url)
+                    self._batch_pending.discard(i)
                     continue
 
                 # Проверяем robots.txt
@@ -435,26 +676,71 @@ class WebCrawler:
                 #     self.visited_urls.add(url)
                 #     continue
 
-                logger.info(f"Обкачка [{processed_count + 1}] [{source_name}]: {url}")
+                self.visited_urls.add(url)
+                self.host_locks.setdefault(_parsed(url).netloc, threading.Lock())
+                futures[executor.submit(self.fetch_page_politely, url)] = i
 
-                # Загружаем страницу
-                html_content = self.fetch_page(url)
+            for future in as_completed(futures):
+                i = futures.pop(future)
+                url = urls[i]
+                source_name = sources[i]
 
-                if html_content:
-                    # Сохраняем документ
-                    self.save_document(url, html_content, source_name)
-                    self.visited_urls.add(url)
-                    processed_count += 1
+                html_bytes, encoding = future.result() or (None, None)
+                if not html_bytes:
+                    self._batch_pending.discard(i)
+                    continue
+
+                logger.info(f"Обкачка [{processed_count + 1}] [{source_name}]: {url}")
 
-                # Задержка между запросами
-                time.sleep(self.delay)
+                # Сохраняем документ
+                self.save_document(url, html_bytes, source_name, existing, encoding)
+                self._batch_pending.discard(i)
+                processed_count += 1
 
                 # Периодически сохраняем состояние
-                if processed_count % 10 == 0:
+                if processed_count % self.write_batch_size == 0:
                     self.save_queue_state()
                     logger.info(
                         f"Прогресс: обработано {processed_count} документов, "
-                        f"осталось {len(self.queue)} в очереди"
+                        f"осталось {len(self.queue_urls) + len(self._batch_pending)} "
+                        f"в очереди"
+                    )
+        finally:
+            for future in futures:
+                future.cancel()
+
+            # Возвращаем необработанные URL в начало очереди
+            pending_urls, pending_sources, pending_lastmods = self._unfinished_batch()
+            self.queue_urls.extendleft(reversed(pending_urls))
+            self.queue_sources.extendleft(reversed(pending_sources))
+            self.queue_lastmod.extendleft(reversed(pending_lastmods))
+            self._batch = ([], [], [])
+            self._batch_pending = set()
+
+        return processed_count
+
+    def crawl(self):
+        """Основной цикл обкачки"""
+        logger.info("Запуск поискового робота")
+
+        # Пытаемся загрузить состояние очереди
+        if not self.load_queue_state():
+            # Если очередь пуста, инициализируем из источников
+            self.initialize_sources()
+            self.save_queue_state()
+
+        if not self.queue_urls:
+            logger.error("Очередь пуста! Нечего обкачивать.")
+            return
+
+        try:
+            processed_count = 0
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while self.queue_urls:
+                    urls, sources, lastmods = self._pop_batch()
+                    processed_count = self._crawl_batch(
+                        executor, urls, sources, lastmods, processed_count
                     )
 
         except KeyboardInterrupt:
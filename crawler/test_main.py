@@ -0,0 +1,123 @@
+import gzip
+import threading
+import zlib
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import orjson
+
+from main import WebCrawler
+
+NS = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+
+
+def urlset(base, prefix, count):
+    urls = "".join(f"<url><loc>{base}/{prefix}{i}</loc></url>" for i in range(count))
+    return f'<?xml version="1.0"?><urlset {NS}>{urls}</urlset>'.encode("utf-8")
+
+
+class SitemapHandler(BaseHTTPRequestHandler):
+    pages = {}
+
+    def do_GET(self):
+        body = self.pages.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ParseSitemapTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SitemapHandler)
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        config = {"logic": {"delay": 0}}
+        with mock.patch.object(
+            WebCrawler, "_load_config", return_value=config
+        ), mock.patch.object(WebCrawler, "_init_database", return_value=None):
+            self.crawler = WebCrawler("config.yaml")
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sitemap_index_with_plain_and_gzip_children(self):
+        index = (
+            f'<?xml version="1.0"?><sitemapindex {NS}>'
+            f"<sitemap><loc>{self.base}/a.xml</loc></sitemap>"
+            f"<sitemap><loc>{self.base}/b.xml.gz</loc></sitemap>"
+            f"</sitemapindex>"
+        ).encode("utf-8")
+        SitemapHandler.pages = {
+            "/index.xml": index,
+            "/a.xml": urlset(self.base, "a", 5),
+            "/b.xml.gz": gzip.compress(urlset(self.base, "b", 5)),
+        }
+
+        self.crawler.parse_sitemap(f"{self.base}/index.xml", "s")
+
+        self.assertEqual(self.crawler.count_map, {"s": 10})
+        self.assertEqual(len(self.crawler.queue_urls), 10)
+
+
+class QueueCheckpointTest(unittest.TestCase):
+    def setUp(self):
+        config = {"logic": {"delay": 0, "max_workers": 1}}
+        self.db = mock.MagicMock()
+        self.db.documents.find.return_value = []
+        self.db.queue_state.find_one.return_value = None
+        with mock.patch.object(
+            WebCrawler, "_load_config", return_value=config
+        ), mock.patch.object(WebCrawler, "_init_database", return_value=self.db):
+            self.crawler = WebCrawler("config.yaml")
+        self.crawler.write_batch_size = 2
+
+    def test_checkpoint_keeps_unfinished_batch(self):
+        urls = [f"https://a.com/{i}" for i in range(10)]
+        for url in urls:
+            self.crawler.enqueue(url, "s", None)
+
+        with mock.patch.object(
+            self.crawler, "fetch_page", return_value=(b"<html/>", "utf-8")
+        ):
+            self.crawler.crawl()
+
+        # Снимок [0] делается до обкачки, [1] - после 2 документов из пачки
+        checkpoint = self.db.queue_state.replace_one.call_args_list[1]
+        state = orjson.loads(zlib.decompress(checkpoint.args[1]["blob"]))
+        self.assertEqual(len(state["url"]), 8)
+        self.assertEqual(state["url"], urls[2:])
+        self.assertEqual(state["source_name"], ["s"] * 8)
+        self.assertEqual(state["lastmod"], [None] * 8)
+
+        # После полной обкачки очередь пуста
+        last_call = self.db.queue_state.replace_one.call_args_list[-1]
+        state = orjson.loads(zlib.decompress(last_call.args[1]["blob"]))
+        self.assertEqual(state["url"], [])
+
+    def test_legacy_queue_is_migrated(self):
+        urls = [f"https://a.com/{i}" for i in range(3)]
+        self.db.queue.find.return_value = [
+            {"url": url, "source_name": "s", "lastmod": None} for url in urls
+        ]
+
+        fetch_page = mock.Mock(return_value=(b"<html/>", "utf-8"))
+        with mock.patch.object(self.crawler, "fetch_page", fetch_page):
+            self.crawler.crawl()
+
+        self.assertEqual(sorted(c.args[0] for c in fetch_page.call_args_list), urls)
+        self.db.queue.drop.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
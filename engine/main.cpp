@@ -362,12 +362,50 @@ void search_boolean(const std::string& query) {
     }
 }
 
+void run_query(const std::string& query) {
+    // Определяем тип запроса
+    bool is_simple = true;
+    for (char c : query) {
+        if (c == '&' || c == '|' || c == '!' || c == '(' || c == ')') {
+            is_simple = false;
+            break;
+        }
+    }
+
+    if (is_simple) {
+        // Простой однотермовый запрос
+        search_single_term(query);
+    } else {
+        // Булев запрос
+        search_boolean(query);
+    }
+}
+
+void serve() {
+    // Построчный протокол: один запрос на строку,
+    // ответ завершается пустой строкой
+    std::cerr.rdbuf(std::cout.rdbuf());
+
+    // Индексы загружены - сообщаем о готовности
+    std::cout << "ready\n\n" << std::flush;
+
+    std::string query;
+    while (std::getline(std::cin, query)) {
+        if (!query.empty()) {
+            run_query(query);
+        }
+        std::cout << "\n" << std::flush;
+    }
+}
+
 int main(int argc, char* argv[]) {
     // Загружаем индексы
     load_forward("forward.idx");
     load_inverted("inverted.idx");
 
-    if (argc > 1) {
+    if (argc == 2 && std::string(argv[1]) == "--serve") {
+        serve();
+    } else if (argc > 1) {
         std::string query;
 
         for (int i = 1; i < argc; i++) {
@@ -375,22 +413,7 @@ int main(int argc, char* argv[]) {
             query += argv[i];
         }
 
-        // Определяем тип запроса
-        bool is_simple = true;
-        for (char c : query) {
-            if (c == '&' || c == '|' || c == '!' || c == '(' || c == ')') {
-                is_simple = false;
-                break;
-            }
-        }
-
-        if (is_simple) {
-            // Простой однотермовый запрос
-            search_single_term(query);
-        } else {
-            // Булев запрос
-            search_boolean(query);
-        }
+        run_query(query);
     } else {
         std::cout << "Search engine loaded.\n";
         std::cout << "Documents: " << documents.size() << "\n";
@@ -411,19 +434,7 @@ int main(int argc, char* argv[]) {
         while (std::getline(std::cin, query)) {
             if (query.empty()) break;
 
-            bool is_simple = true;
-            for (char c : query) {
-                if (c == '&' || c == '|' || c == '!' || c == '(' || c == ')') {
-                    is_simple = false;
-                    break;
-                }
-            }
-
-            if (is_simple) {
-                search_single_term(query);
-            } else {
-                search_boolean(query);
-            }
+            run_query(query);
 
             std::cout << "\nEnter search query (empty to exit): ";
         }
@@ -1,17 +1,19 @@
 import os
+import select
+import signal
 import subprocess
+import threading
+import time
 import urllib.parse
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 ENGINE_PATH = os.path.join(BASE_DIR, "engine")
 FORWARD_IDX = os.path.join(BASE_DIR, "forward.idx")
 INVERTED_IDX = os.path.join(BASE_DIR, "inverted.idx")
+ENGINE_TIMEOUT = 5
 
-
-class Handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        html = """
+HEADER = """
         <html><body>
         <h1>Поиск</h1>
         <form>
@@ -19,52 +21,135 @@ class Handler(BaseHTTPRequestHandler):
             <input type="submit" value="Искать">
         </form>
         <hr>
-        """
-
-        if "?" in self.path:
-            query_part = self.path.split("?")[1]
-            params = urllib.parse.parse_qs(query_part)
-            query = params.get("q", [""])[0]
-
-            if query:
-                query = urllib.parse.unquote(query)
-                print(f"Поисковый запрос: '{query}'")
-
-                try:
-                    if not os.path.exists(ENGINE_PATH):
-                        html += "<p style='color:red'>Файл engine не найден</p>"
-                    elif not os.path.exists(FORWARD_IDX):
-                        html += "<p style='color:red'>Файл forward.idx не найден</p>"
-                    elif not os.path.exists(INVERTED_IDX):
-                        html += "<p style='color:red'>Файл inverted.idx не найден</p>"
-                    else:
-                        original_cwd = os.getcwd()
-                        os.chdir(BASE_DIR)
-
-                        result = subprocess.run(
-                            ["./engine", query],
-                            capture_output=True,
-                            text=True,
-                            timeout=5,
-                            encoding="utf-8",
-                        )
-
-                        os.chdir(original_cwd)
-
-                        html += f"<h3>Результаты для '{query}':</h3>"
-                        html += f"<pre>{result.stdout}</pre>"
-                        if result.returncode != 0:
-                            html += f"<pre style='color:red'>{result.stderr}</pre>"
-
-                except Exception as e:
-                    html += f"<p style='color:red'>Ошибка: {e}</p>"
-
-        html += "</body></html>"
+        """.encode("utf-8")
+FOOTER = b"</body></html>"
+
+
+def check_files():
+    if not os.path.exists(ENGINE_PATH):
+        return "<p style='color:red'>Файл engine не найден</p>".encode("utf-8")
+    if not os.path.exists(FORWARD_IDX):
+        return "<p style='color:red'>Файл forward.idx не найден</p>".encode("utf-8")
+    if not os.path.exists(INVERTED_IDX):
+        return "<p style='color:red'>Файл inverted.idx не найден</p>".encode("utf-8")
+    return b""
+
+
+# Проверяется при запуске сервера и по SIGHUP
+MISSING_FILES_HTML = b""
+
+
+def recheck_files(signum=None, frame=None):
+    global MISSING_FILES_HTML
+    MISSING_FILES_HTML = check_files()
+    if MISSING_FILES_HTML:
+        print(MISSING_FILES_HTML.decode("utf-8"))
+
+
+class Engine:
+    """Долгоживущий процесс engine, обрабатывающий запросы построчно"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.process = None
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            [ENGINE_PATH, "--serve"],
+            cwd=BASE_DIR,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=0,
+        )
+
+        # Загрузка индексов может быть долгой, поэтому ждем без таймаута
+        try:
+            ready = self._read_response(timeout=None)
+        except Exception:
+            self._stop()
+            raise
+        if ready != "ready\n":
+            self._stop()
+            raise RuntimeError(f"Неожиданный ответ engine при запуске: {ready!r}")
+
+    def start(self):
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+
+    def _stop(self):
+        self.process.kill()
+        self.process.wait()
+        self.process = None
+
+    def _read_response(self, timeout=ENGINE_TIMEOUT):
+        # Ответ engine завершается пустой строкой
+        fd = self.process.stdout.fileno()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        data = b""
+
+        while not data.endswith(b"\n\n"):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("engine не ответил вовремя")
+            if not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError("engine не ответил вовремя")
+
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise RuntimeError("engine завершил работу")
+            data += chunk
+
+        return data[:-1].decode("utf-8", errors="replace")
+
+    def search(self, query):
+        query = query.replace("\r", " ").replace("\n", " ")
+
+        with self.lock:
+            if self.process is None or self.process.poll() is not None:
+                self._start()
+
+            try:
+                self.process.stdin.write(query.encode("utf-8") + b"\n")
+                return self._read_response()
+            except Exception:
+                self._stop()
+                raise
+
+
+engine = Engine()
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        html = bytearray(HEADER)
+
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        query = params.get("q", [""])[0]
+
+        if query:
+            query = urllib.parse.unquote(query)
+            print(f"Поисковый запрос: '{query}'")
+
+            try:
+                if MISSING_FILES_HTML:
+                    html += MISSING_FILES_HTML
+                else:
+                    result = engine.search(query)
+
+                    html += f"<h3>Результаты для '{query}':</h3>".encode("utf-8")
+                    html += f"<pre>{result}</pre>".encode("utf-8")
+
+            except Exception as e:
+                html += f"<p style='color:red'>Ошибка: {e}</p>".encode("utf-8")
+
+        html += FOOTER
 
         self.send_response(200)
         self.send_header("Content-type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
         self.end_headers()
-        self.wfile.write(html.encode("utf-8"))
+        self.wfile.write(html)
 
 
 if __name__ == "__main__":
@@ -72,7 +157,15 @@ if __name__ == "__main__":
     print(f"Путь к engine: {ENGINE_PATH}")
     print(f"Путь к forward.idx: {FORWARD_IDX}")
     print(f"Путь к inverted.idx: {INVERTED_IDX}")
+
+    recheck_files()
+    signal.signal(signal.SIGHUP, recheck_files)
+
+    if not MISSING_FILES_HTML:
+        print("Запуск engine и загрузка индексов...")
+        engine.start()
+
     print("Сервер запущен: http://localhost:8000")
 
-    server = HTTPServer(("0.0.0.0", 8000), Handler)
+    server = ThreadingHTTPServer(("0.0.0.0", 8000), Handler)
     server.serve_forever()
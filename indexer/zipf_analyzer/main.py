@@ -3,7 +3,7 @@ import sys
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from scipy.optimize import curve_fit
+from scipy.optimize import least_squares
 
 
 def zipf_law(rank, C):
@@ -14,22 +14,57 @@ def mandelbrot_law(rank, C, B):
     return C / (rank + B)
 
 
+def fit_mandelbrot(ranks, frequencies, C0, B0=1.0):
+    # Подгонка в логарифмах: log(f) = log(C) - log(rank + B)
+    log_freq = np.log(frequencies)
+
+    def residuals(p):
+        return log_freq - p[0] + np.log(ranks + p[1])
+
+    def jacobian(p):
+        jac = np.empty((len(ranks), 2))
+        jac[:, 0] = -1.0
+        jac[:, 1] = 1.0 / (ranks + p[1])
+        return jac
+
+    result = least_squares(
+        residuals, x0=[np.log(C0), B0], jac=jacobian, method="lm", xtol=1e-6
+    )
+    if not result.success:
+        raise RuntimeError(result.message)
+
+    log_C, B = result.x
+    return np.exp(log_C), B
+
+
 def plot_zipf(csv_file, output_prefix="zipf_analysis"):
     print(f"Reading data from {csv_file}...")
-    df = pd.read_csv(csv_file)
+    df = pd.read_csv(
+        csv_file,
+        usecols=["rank", "term", "frequency"],
+        dtype={"rank": np.int32, "term": "string", "frequency": np.int64},
+        engine="c",
+    )
 
     ranks = df["rank"].values
     frequencies = df["frequency"].values
 
     print(f"Total unique terms: {len(ranks)}")
-    print(f"Total term occurrences: {sum(frequencies)}")
+    print(f"Total term occurrences: {frequencies.sum()}")
     print("\nTop 20 terms:")
     print(df.head(20)[["rank", "term", "frequency"]].to_string(index=False))
 
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 6))
 
+    # Для точечного графика берем ~2000 точек, равномерно по логарифму ранга
+    idx = np.unique(np.geomspace(1, len(ranks), 2000).astype(int)) - 1
     ax1.loglog(
-        ranks, frequencies, "o", markersize=2, alpha=0.5, label="Реальные данные"
+        ranks[idx],
+        frequencies[idx],
+        "o",
+        markersize=2,
+        alpha=0.5,
+        label="Реальные данные",
     )
 
     C_ideal = frequencies[0]
@@ -39,8 +74,7 @@ def plot_zipf(csv_file, output_prefix="zipf_analysis"):
     )
 
     try:
-        popt, _ = curve_fit(mandelbrot_law, ranks, frequencies, p0=[C_ideal, 1.0])
-        C_mand, B_mand = popt
+        C_mand, B_mand = fit_mandelbrot(ranks, frequencies, C_ideal)
         mandelbrot_fit = mandelbrot_law(ranks, C_mand, B_mand)
         ax1.loglog(
             ranks,
@@ -72,22 +106,22 @@ def plot_zipf(csv_file, output_prefix="zipf_analysis"):
     plt.savefig(filename, dpi=150, bbox_inches="tight")
     print(f"\nGraph saved to: {filename}")
 
-    zipf_error = np.mean(np.abs(frequencies - zipf_ideal) / frequencies) * 100
+    zipf_error = np.mean(np.abs(1 - zipf_ideal / frequencies)) * 100
     print(f"Средняя относительная ошибка закона Ципфа: {zipf_error:.2f}%")
 
     print("\n=== СТАТИСТИКА ===")
-    hapax = sum(1 for f in frequencies if f == 1)
+    hapax = int(np.count_nonzero(frequencies == 1))
     print(
         f"Hapax legomena (частота=1): {hapax} ({hapax / len(frequencies) * 100:.1f}%)"
     )
 
-    high_freq = sum(1 for f in frequencies if f > 1000)
+    high_freq = int(np.count_nonzero(frequencies > 1000))
     print(f"Высокочастотные термы (>1000): {high_freq}")
 
-    medium_freq = sum(1 for f in frequencies if 10 < f <= 1000)
+    medium_freq = int(np.count_nonzero((frequencies > 10) & (frequencies <= 1000)))
     print(f"Среднечастотные термы (10-1000): {medium_freq}")
 
-    low_freq = sum(1 for f in frequencies if 1 < f <= 10)
+    low_freq = int(np.count_nonzero((frequencies > 1) & (frequencies <= 10)))
     print(f"Низкочастотные термы (2-10): {low_freq}")
 
 